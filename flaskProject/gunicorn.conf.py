@@ -0,0 +1,9 @@
+import multiprocessing
+
+# The data lives in memory, so a single worker process keeps it shared and its
+# threads serve the requests concurrently
+bind = "0.0.0.0:5000"
+workers = 1
+worker_class = "gthread"
+threads = multiprocessing.cpu_count() * 2
+keepalive = 5
@@ -1,458 +1,401 @@
-from flask import Flask, render_template, request, jsonify, Response, abort
+from flask import Flask, render_template, request, Response, abort
+from flask_compress import Compress
 
-import xmltodict
+import os
 import uuid
+import store
 import validator
-import json
+import orjson
+from records import Product, Employee, Customer, Sale
+from lxml import etree
+from jinja2 import FileSystemBytecodeCache
 
 app = Flask(__name__)
+# Bodies over 1 MB are refused before they are read into memory
+app.config["MAX_CONTENT_LENGTH"] = 1024 * 1024
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+compress = Compress(app)
+
+# Sent in every ETag next to the collection version, so an ETag from before a
+# restart never matches
+startupID = uuid.uuid4().hex
+
+# The serialized JSON of every collection, together with its version. The body
+# is kept per content encoding, so it is compressed once per version too
+bodies = {}
+
+
+############################ Helpers #################################
+# Serialize data with orjson instead of the stdlib json used by jsonify
+def jsonResponse(data, status=200):
+    return Response(orjson.dumps(data), status=status, mimetype="application/json")
+
+
+def collectionETag(name, version):
+    return "%s-%s-%d" % (name, startupID, version)
+
+
+# Send a body that is reused between requests. variants holds the plain
+# body under None and every compressed form made so far, so each encoding is
+# compressed only once. The response has its Content-Encoding already, so
+# Flask-Compress leaves it alone
+def encodedResponse(variants, mimetype):
+    encoding = None
+    if len(variants[None]) >= app.config["COMPRESS_MIN_SIZE"]:
+        encoding = request.accept_encodings.best_match(app.config["COMPRESS_ALGORITHM"])
+    if encoding not in variants:
+        variants[encoding] = compress.compress(app, Response(variants[None]), encoding)
+
+    response = Response(variants[encoding], mimetype=mimetype)
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+# The validators of a collection, sent with the body and with a 304 alike
+def collectionHeaders(response, etag):
+    response.set_etag(etag)
+    response.vary.add("Accept-Encoding")
+    response.headers["Cache-Control"] = "private, must-revalidate"
+    return response
+
+
+# Send a collection, or 304 when the client already has this version of it
+def collectionResponse(name):
+    encodings = app.config["COMPRESS_ALGORITHM"]
+    version = store.versions[name]
+    # Flask-Compress adds the encoding to the ETag of a compressed body, so the
+    # client may send back any of these
+    etag = collectionETag(name, version)
+    for tag in [etag] + [etag + ":" + encoding for encoding in encodings]:
+        if request.if_none_match.contains_weak(tag):
+            response = Response(status=304)
+            del response.headers["Content-Type"]
+            return collectionHeaders(response, tag)
+
+    bodyVersion, body = bodies.get(name, (None, None))
+    if bodyVersion != version:
+        # Serialized outside the store lock, so writers never wait on orjson
+        version, records = store.snapshot(name)
+        body = {None: orjson.dumps(records)}
+        bodies[name] = (version, body)
+
+    response = encodedResponse(body, "application/json")
+    etag = collectionETag(name, version)
+    if "Content-Encoding" in response.headers:
+        etag += ":" + response.headers["Content-Encoding"]
+    return collectionHeaders(response, etag)
+
+
+# The empty search forms never change, so browsers may cache them for an hour
+def formResponse(template):
+    response = encodedResponse(formHtml[template], "text/html")
+    response.cache_control.max_age = 3600
+    response.cache_control.public = True
+    return response
+
+
+# Parse XML with lxml instead of xmltodict, the same tree is validated and
+# flattened so the body is parsed only once. Entities are not resolved, so a
+# body with a DTD or entity references is refused instead of losing their text
+def parseXml(data):
+    try:
+        root = etree.fromstring(data, validator.get_parser())
+    except etree.XMLSyntaxError:
+        abort(400)
+    if root.getroottree().docinfo.doctype or next(root.iter(etree.Entity), None) is not None:
+        abort(400)
+    return root
+
+
+# XML only holds text, so every value is converted to the type of its field in
+# the record, an empty element becomes "" like in JSON. Comments between the
+# fields are skipped and a field that is given twice is a bad request
+def xmlToDict(root, recordType):
+    fieldTypes = recordType.__annotations__
+    data = {}
+    for child in root.iterchildren(etree.Element):
+        if child.tag in data:
+            abort(400)
+        text = "".join(child.itertext())
+        try:
+            data[child.tag] = fieldTypes.get(child.tag, str)(text)
+        except ValueError:
+            abort(400)
+    return data
+
+
+# Turn a parsed body into a record, a body with missing or unknown fields is a bad request
+def toRecord(recordType, data):
+    try:
+        return recordType(**data)
+    except TypeError:
+        abort(400)
+
+
+# Parse a JSON record with orjson instead of the stdlib json behind request.json
+def jsonToDict(data):
+    try:
+        record = orjson.loads(data)
+    except orjson.JSONDecodeError:
+        abort(400)
+    if not record or not isinstance(record, dict):
+        abort(400)
+    return record
+
+
+############################ Handlers ################################
+# The body of a POST or PUT request for a recordType as dict, checked against
+# the schemas when validate is set
+def parseBody(recordType, validate=False):
+    # The body is read once and not kept on the request after parsing, only
+    # form data is size checked by Werkzeug itself. A chunked body has no
+    # Content-Length, so at most one byte over the limit is read to find out
+    if (request.content_length or 0) > request.max_content_length:
+        abort(413)
+    body = request.stream.read(request.max_content_length + 1)
+    if len(body) > request.max_content_length:
+        abort(413)
+
+    # als het XML is
+    if request.mimetype == "application/xml":
+        root = parseXml(body)
+        if validate and not validator.is_valid_xml(root):
+            abort(400)
+        return xmlToDict(root, recordType)
 
-# Data
-products = [
-    {"productID": 1, "name": "cat food", "price": 1.25},
-    {"productID": 2, "name": "dog food", "price": 5.35},
-    {"productID": 3, "name": "guinea pig food", "price": 12.00}
-]
-
-employees = [
-    {"employeeID": 100, "firstName": "Pieter", "middleInitial": "", "lastName": "Post"},
-    {"employeeID": 101, "firstName": "Jannie", "middleInitial": "", "lastName": "Post"},
-    {"employeeID": 102, "firstName": "Jannes", "middleInitial": "", "lastName": "Post"}
-]
-
-customers = [
-    {"customerID": 10, "firstName": "Karel", "middleInitial": "", "lastName": "Bos"},
-    {"customerID": 11, "firstName": "Jan", "middleInitial": "", "lastName": "Pieter"},
-    {"customerID": 12, "firstName": "Bert", "middleInitial": "en", "lastName": "Ernie"}
-]
-sales = [
-    {"salesID": 21, "salesPersonalID": 211, "customerID": 201, "productID": 31, "quantity": 75},
-    {"salesID": 22, "salesPersonalID": 206, "customerID": 303, "productID": 6, "quantity": 5},
-    {"salesID": 23, "salesPersonalID": 207, "customerID": 303, "productID": 8, "quantity": 5}
-]
+    # als het JSON is
+    data = jsonToDict(body)
+    if validate and not validator.is_valid_json(data):
+        abort(400)
+    return data
+
+
+# The POST, PUT and DELETE handlers are the same for every collection, so they
+# are built from these factories instead of written out four times
+def makePost(name, recordType, idField, validate=False):
+    def handler():
+        data = parseBody(recordType, validate)
+        data[idField] = store.nextID()
+        record = toRecord(recordType, data)
+        store.add(name, data[idField], record)
+        return jsonResponse(record, 201)
+    return handler
+
+
+def makePut(name, recordType, idField, validate=False):
+    def handler(recordID):
+        if store.get(name, recordID) is None:
+            abort(404)
+        data = parseBody(recordType, validate)
+        data[idField] = recordID
+        record = toRecord(recordType, data)
+        if not store.replace(name, recordID, record):
+            abort(404)
+        return jsonResponse(record)
+    return handler
+
+
+def makeDelete(name):
+    def handler(recordID):
+        if not store.remove(name, recordID):
+            print(str(recordID) + " Has not been deleted")
+            abort(404)
+        print(str(recordID) + " Has been deleted")
+        return Response(status=200)
+    return handler
 
 
 ############################ Homepage ################################
-# The home page
+# The home page and the empty and "No result" search pages are static, so they
+# are rendered once at startup and compressed once per encoding
+searchPages = ["product.html", "employee.html", "customer.html", "sale.html"]
+with app.app_context():
+    homeHtml = {None: render_template("home.html").encode("utf-8")}
+    formHtml = {page: {None: render_template(page).encode("utf-8")} for page in searchPages}
+    noResultHtml = {page: {None: render_template(page, noresult="No result").encode("utf-8")}
+                    for page in searchPages}
+
+
 @app.route('/', methods=['GET'])
 def home():
-    return render_template("home.html")
+    return encodedResponse(homeHtml, "text/html")
 
 
 ############################ Product ################################
 # GET the products
 @app.route('/products', methods=['GET'])
 def getProducts():
-    return jsonify(products)
+    return collectionResponse("products")
 
 
 # GET the product with ID
 @app.route('/product', methods=["GET", "POST"])
 def getProductWithID():
     if request.method == "POST":
-        # todo dont use hardcode validate
-        productInput = request.form.get('productInput')
-        if int(productInput) > 0 and int(productInput) < 4:
-            for product in products:
-                if product["productID"] == int(productInput):
-                    pro = product["productID"]
-                    name = product["name"]
-                    price = product["price"]
-                    output = render_template("product.html",
-                                             productID=pro,
-                                             name=name,
-                                             price=price,
-                                             result="yes")
-                    return output
+        try:
+            product = store.get("products", int(request.form.get('productInput')))
+        except (TypeError, ValueError):
+            product = None
+        if product is None:
+            output = encodedResponse(noResultHtml["product.html"], "text/html")
         else:
-            output = render_template("product.html", noresult="No result")
-            return output
+            output = render_template("product.html", product=product)
+        return output
 
     else:
-        output = render_template("product.html")
-        return output
+        return formResponse("product.html")
 
 
 # POST the product
-# todo validation
-@app.route('/products', methods=['POST'])
-def postProducts():
-    content = request.headers.get('Content-Type')
-
-    # als het XML is
-    if content == "application/xml":
-        xmlData = xmltodict.parse(request.data)
-        is_valid = validator.is_valid_xml(xmlData)
-        if is_valid:
-            xmlData["productID"] = uuid.uuid4()
-            products.append(xmlData)
-            return xmlData
-        else:
-            abort(400)
-
-    # als het JSON is
-    else:
-        if not request.json:
-            abort(400)
-        else:
-            jsonData = request.json
-            is_valid = validator.is_valid_json(json.dumps(jsonData))
-            if is_valid:
-                jsonData["productID"] = uuid.uuid4()
-                products.append(jsonData)
-                return jsonData
-            else:
-                abort(400)
+app.add_url_rule('/products', 'postProducts',
+                 makePost("products", Product, "productID", validate=True),
+                 methods=['POST'])
 
 
 # PUT the product
-# todo validation
-@app.route('/products/<productID>', methods=['PUT'])
-def putProducts():
-    content = request.headers.get('Content-Type')
-    pid = request.view_args['productID']
-
-    for product in products:
-        if product["productID"] == pid:
-
-            # als het XML is
-            if content == "application/xml":
-                xmlData = xmltodict.parse(request.data)
-                xmlData["productID"] = pid
-                index = products.index(product)
-                products[index] = xmlData
-                return xmlData
-
-            # als het JSON is
-            else:
-                if not request.json:
-                    abort(400)
-                jsonData = request.json
-                jsonData["productID"] = uuid.uuid4()
-                products.append(jsonData)
-                return jsonData
+app.add_url_rule('/products/<int:recordID>', 'putProducts',
+                 makePut("products", Product, "productID", validate=True),
+                 methods=['PUT'])
 
 
 # DELETE the product
-@app.route('/products/<pid>', methods=['DELETE'])
-def delProducts(pid):
-    response = Response()
-    for product in products:
-        if product["productID"] == int(pid):
-            print(pid + " Has been deleted")
-            products.remove(product)
-            response.status_code = 200
-        else:
-            print(pid + " Has not been deleted")
-            response.status_code = 404
-        return response
+app.add_url_rule('/products/<int:recordID>', 'delProducts',
+                 makeDelete("products"),
+                 methods=['DELETE'])
 
 
 ############################ Employees ################################
 # GET the employees
 @app.route('/employees', methods=['GET'])
 def getEmployees():
-    return jsonify(employees)
+    return collectionResponse("employees")
 
 
 # GET the employee with ID
 @app.route('/employee', methods=["GET", "POST"])
 def getEmployeeWithID():
     if request.method == "POST":
-        employeeInput = request.form.get('employeeInput')
-        # todo dont use hardcode validate
-        if int(employeeInput) > 99 and int(employeeInput) < 103:
-            for employee in employees:
-                if employee["employeeID"] == int(employeeInput):
-                    employeeID = employee["employeeID"]
-                    fname = employee["firstName"]
-                    mname = employee["middleInitial"]
-                    lname = employee["lastName"]
-                    output = render_template("employee.html",
-                                             employeeID=employeeID,
-                                             fname=fname,
-                                             mname=mname,
-                                             lname=lname,
-                                             result="yes")
-                    return output
+        try:
+            employee = store.get("employees", int(request.form.get('employeeInput')))
+        except (TypeError, ValueError):
+            employee = None
+        if employee is None:
+            output = encodedResponse(noResultHtml["employee.html"], "text/html")
         else:
-            output = render_template("employee.html", noresult="No result")
-            return output
+            output = render_template("employee.html", employee=employee)
+        return output
 
     else:
-        output = render_template("employee.html")
-        return output
+        return formResponse("employee.html")
 
 
 # POST the employee
-@app.route('/employees', methods=['POST'])
-def postEmployees():
-    content = request.headers.get('Content-Type')
-
-    # als het XML is
-    if content == "application/xml":
-        xmlData = xmltodict.parse(request.data)
-        xmlData["employeeID"] = uuid.uuid4()
-        products.append(xmlData)
-        return xmlData
-
-    # als het JSON is
-    else:
-        if not request.json:
-            abort(400)
-        jsonData = request.json
-        jsonData["employeeID"] = uuid.uuid4()
-        products.append(jsonData)
-        return jsonData
+app.add_url_rule('/employees', 'postEmployees',
+                 makePost("employees", Employee, "employeeID"),
+                 methods=['POST'])
 
 
 # PUT the employee
-# todo validation
-@app.route('/employees/<employeeID>', methods=['PUT'])
-def putEmployees():
-    content = request.headers.get('Content-Type')
-    eid = request.view_args['employeeID']
-
-    for employee in employees:
-        if employee["employeeID"] == eid:
-
-            # als het XML is
-            if content == "application/xml":
-                xmlData = xmltodict.parse(request.data)
-                xmlData["employeeID"] = eid
-                index = employees.index(employee)
-                employees[index] = xmlData
-                return xmlData
-
-            # als het JSON is
-            else:
-                if not request.json:
-                    abort(400)
-                jsonData = request.json
-                jsonData["employeeID"] = uuid.uuid4()
-                employees.append(jsonData)
-                return jsonData
+app.add_url_rule('/employees/<int:recordID>', 'putEmployees',
+                 makePut("employees", Employee, "employeeID"),
+                 methods=['PUT'])
 
 
 # DELETE the employee
-@app.route('/employees/<employeeID>', methods=['DELETE'])
-def delEmployees(employeeID):
-    response = Response()
-    for employee in employees:
-        if employee["employeeID"] == int(employeeID):
-            print(employeeID + " Has been deleted")
-            employees.remove(employee)
-            response.status_code = 200
-        else:
-            print(employeeID + " Has not been deleted")
-            response.status_code = 404
-        return response
+app.add_url_rule('/employees/<int:recordID>', 'delEmployees',
+                 makeDelete("employees"),
+                 methods=['DELETE'])
 
 
 ############################ Customers ################################
 # GET the customer
 @app.route('/customers', methods=['GET'])
 def getCustomers():
-    return jsonify(customers)
+    return collectionResponse("customers")
 
 
 # GET the customer with ID
 @app.route('/customer', methods=["GET", "POST"])
 def getCustomerWithID():
     if request.method == "POST":
-        customerInput = request.form.get('customerInput')
-        # todo dont use hardcode validate
-        if int(customerInput) > 9 and int(customerInput) < 13:
-            for customer in customers:
-                if customer["customerID"] == int(customerInput):
-                    customerID = customer["customerID"]
-                    fname = customer["firstName"]
-                    mname = customer["middleInitial"]
-                    lname = customer["lastName"]
-                    output = render_template("customer.html",
-                                             customerID=customerID,
-                                             fname=fname,
-                                             mname=mname,
-                                             lname=lname,
-                                             result="yes")
-                    return output
+        try:
+            customer = store.get("customers", int(request.form.get('customerInput')))
+        except (TypeError, ValueError):
+            customer = None
+        if customer is None:
+            output = encodedResponse(noResultHtml["customer.html"], "text/html")
         else:
-            output = render_template("customer.html", noresult="No result")
-            return output
+            output = render_template("customer.html", customer=customer)
+        return output
 
     else:
-        output = render_template("customer.html")
-        return output
+        return formResponse("customer.html")
 
 
 # POST the customer
-@app.route('/customers', methods=['POST'])
-def postCustomers():
-    content = request.headers.get('Content-Type')
-
-    # als het XML is
-    if content == "application/xml":
-        xmlData = xmltodict.parse(request.data)
-        xmlData["customerID"] = uuid.uuid4()
-        products.append(xmlData)
-        return xmlData
-
-    # als het JSON is
-    else:
-        if not request.json:
-            abort(400)
-        jsonData = request.json
-        jsonData["customerID"] = uuid.uuid4()
-        products.append(jsonData)
-        return jsonData
+app.add_url_rule('/customers', 'postCustomers',
+                 makePost("customers", Customer, "customerID"),
+                 methods=['POST'])
 
 
 # PUT the customer
-# todo validation
-@app.route('/customers/<customerID>', methods=['PUT'])
-def putCustomers():
-    content = request.headers.get('Content-Type')
-    cid = request.view_args['customerID']
-
-    for customer in customers:
-        if customer["customerID"] == cid:
-
-            # als het XML is
-            if content == "application/xml":
-                xmlData = xmltodict.parse(request.data)
-                xmlData["customerID"] = cid
-                index = customers.index(customer)
-                customers[index] = xmlData
-                return xmlData
-
-            # als het JSON is
-            else:
-                if not request.json:
-                    abort(400)
-                jsonData = request.json
-                jsonData["customerID"] = uuid.uuid4()
-                customers.append(jsonData)
-                return jsonData
+app.add_url_rule('/customers/<int:recordID>', 'putCustomers',
+                 makePut("customers", Customer, "customerID"),
+                 methods=['PUT'])
 
 
 # DELETE the customers
-@app.route('/customers/<customerID>', methods=['DELETE'])
-def delCustomers(customerID):
-    response = Response()
-    for customer in customers:
-        if customer["customerID"] == int(customerID):
-            print(customerID + " Has been deleted")
-            customers.remove(customer)
-            response.status_code = 200
-        else:
-            print(customerID + " Has not been deleted")
-            response.status_code = 404
-        return response
+app.add_url_rule('/customers/<int:recordID>', 'delCustomers',
+                 makeDelete("customers"),
+                 methods=['DELETE'])
 
 
 ############################ Sale #####################################
 # GET the sale
 @app.route('/sales', methods=['GET'])
 def getSales():
-    return jsonify(sales)
+    return collectionResponse("sales")
 
 
 # GET the sale with ID
 @app.route('/sale', methods=["GET", "POST"])
 def getSaleWithID():
     if request.method == "POST":
-        saleInput = request.form.get('saleInput')
-        # todo dont use hardcode validate
-        if int(saleInput) > 20 and int(saleInput) < 24:
-            for sale in sales:
-                if sale["salesID"] == int(saleInput):
-                    salesID = sale["salesID"]
-                    spID = sale["salesPersonalID"]
-                    cid = sale["customerID"]
-                    pid = sale["productID"]
-                    qua = sale["quantity"]
-                    output = render_template("sale.html",
-                                             salesID=salesID,
-                                             spID=spID,
-                                             cid=cid,
-                                             pid=pid,
-                                             qua=qua,
-                                             result="yes")
-                    return output
+        try:
+            sale = store.get("sales", int(request.form.get('saleInput')))
+        except (TypeError, ValueError):
+            sale = None
+        if sale is None:
+            output = encodedResponse(noResultHtml["sale.html"], "text/html")
         else:
-            output = render_template("sale.html", noresult="No result")
-            return output
+            output = render_template("sale.html", sale=sale)
+        return output
 
     else:
-        output = render_template("sale.html")
-        return output
+        return formResponse("sale.html")
 
 
 # PUT the sale
-# todo validation
-@app.route('/sales/<saleID>', methods=['PUT'])
-def putSales():
-    content = request.headers.get('Content-Type')
-    cid = request.view_args['saleID']
-
-    for sale in sales:
-        if sale["saleID"] == cid:
-
-            # als het XML is
-            if content == "application/xml":
-                xmlData = xmltodict.parse(request.data)
-                xmlData["saleID"] = cid
-                index = customers.index(sale)
-                sale[index] = xmlData
-                return xmlData
-
-            # als het JSON is
-            else:
-                if not request.json:
-                    abort(400)
-                jsonData = request.json
-                jsonData["saleID"] = uuid.uuid4()
-                sale.append(jsonData)
-                return jsonData
+app.add_url_rule('/sales/<int:recordID>', 'putSales',
+                 makePut("sales", Sale, "salesID"),
+                 methods=['PUT'])
 
 
 # POST the sale
-@app.route('/sales', methods=['POST'])
-def postSales():
-    content = request.headers.get('Content-Type')
-
-    # als het XML is
-    if content == "application/xml":
-        xmlData = xmltodict.parse(request.data)
-        xmlData["salesID"] = uuid.uuid4()
-        products.append(xmlData)
-        return xmlData
-
-    # als het JSON is
-    else:
-        if not request.json:
-            abort(400)
-        jsonData = request.json
-        jsonData["salesID"] = uuid.uuid4()
-        products.append(jsonData)
-        return jsonData
+app.add_url_rule('/sales', 'postSales',
+                 makePost("sales", Sale, "salesID"),
+                 methods=['POST'])
 
 
 # DELETE the sale
-@app.route('/sales/<salesID>', methods=['DELETE'])
-def delSales(salesID):
-    response = Response()
-    for sale in sales:
-        if sale["salesID"] == int(salesID):
-            print(salesID + " Has been deleted")
-            sales.remove(sale)
-            response.status_code = 200
-        else:
-            print(salesID + " Has not been deleted")
-            response.status_code = 404
-        return response
+app.add_url_rule('/sales/<int:recordID>', 'delSales',
+                 makeDelete("sales"),
+                 methods=['DELETE'])
 
 
-# Debug function enabled
+# Debug function enabled with FLASK_DEBUG=1 only, use wsgi.py in production
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    debug = os.environ.get("FLASK_DEBUG", "0") == "1"
+    app.run(debug=debug, use_reloader=debug, threaded=True)
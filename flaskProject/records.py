@@ -0,0 +1,39 @@
+from dataclasses import dataclass
+
+
+# The records are dataclasses with __slots__ instead of dicts, which keeps every
+# row small and lets orjson serialize them directly
+@dataclass
+class Product:
+    __slots__ = ("productID", "name", "price")
+    productID: int
+    name: str
+    price: float
+
+
+@dataclass
+class Employee:
+    __slots__ = ("employeeID", "firstName", "middleInitial", "lastName")
+    employeeID: int
+    firstName: str
+    middleInitial: str
+    lastName: str
+
+
+@dataclass
+class Customer:
+    __slots__ = ("customerID", "firstName", "middleInitial", "lastName")
+    customerID: int
+    firstName: str
+    middleInitial: str
+    lastName: str
+
+
+@dataclass
+class Sale:
+    __slots__ = ("salesID", "salesPersonalID", "customerID", "productID", "quantity")
+    salesID: int
+    salesPersonalID: int
+    customerID: int
+    productID: int
+    quantity: int
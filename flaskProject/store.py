@@ -0,0 +1,83 @@
+from records import Product, Employee, Customer, Sale
+
+import itertools
+import threading
+
+# The single place the data lives, every handler and thread works on these
+# collections and changes them only through the functions below
+lock = threading.Lock()
+
+# Data, every collection is a dict on the ID of its records, which also keeps
+# the records in the order they were added
+products = {product.productID: product for product in (
+    Product(1, "cat food", 1.25),
+    Product(2, "dog food", 5.35),
+    Product(3, "guinea pig food", 12.00)
+)}
+
+employees = {employee.employeeID: employee for employee in (
+    Employee(100, "Pieter", "", "Post"),
+    Employee(101, "Jannie", "", "Post"),
+    Employee(102, "Jannes", "", "Post")
+)}
+
+customers = {customer.customerID: customer for customer in (
+    Customer(10, "Karel", "", "Bos"),
+    Customer(11, "Jan", "", "Pieter"),
+    Customer(12, "Bert", "en", "Ernie")
+)}
+
+sales = {sale.salesID: sale for sale in (
+    Sale(21, 211, 201, 31, 75),
+    Sale(22, 206, 303, 6, 5),
+    Sale(23, 207, 303, 8, 5)
+)}
+
+collections = {"products": products, "employees": employees, "customers": customers, "sales": sales}
+
+# Version of every collection, bumped on each change
+versions = {"products": 0, "employees": 0, "customers": 0, "sales": 0}
+
+# Integer IDs for new records
+ids = itertools.count(10_000)
+
+
+def nextID():
+    with lock:
+        return next(ids)
+
+
+# The version of a collection with a copy of its records, taken together under
+# the lock so they match and no write changes the dict while it is copied
+def snapshot(name):
+    with lock:
+        return versions[name], list(collections[name].values())
+
+
+def get(name, recordID):
+    return collections[name].get(recordID)
+
+
+def add(name, recordID, record):
+    with lock:
+        collections[name][recordID] = record
+        versions[name] += 1
+
+
+# Returns False when there is no record with this ID
+def replace(name, recordID, record):
+    with lock:
+        if recordID not in collections[name]:
+            return False
+        collections[name][recordID] = record
+        versions[name] += 1
+        return True
+
+
+# Returns False when there is no record with this ID
+def remove(name, recordID):
+    with lock:
+        if collections[name].pop(recordID, None) is None:
+            return False
+        versions[name] += 1
+        return True
@@ -1,31 +1,57 @@
+import fastjsonschema
 import json
-import jsonschema
 from lxml.etree import XMLSchema
 from lxml import etree
 import os
+import threading
 
 dirname = os.path.dirname(__file__)
 
+# Parsed once, instead of reading the XSD file on every request. lxml validates
+# without holding the GIL, every thread gets its own compiled schema so the
+# threads of a gunicorn worker validate in parallel without sharing its error log
+filenameXML = os.path.join(dirname, "../Schemas/XSD/datasetXSD.xsd")
+xsdDocument = etree.parse(filenameXML)
+schemas = threading.local()
 
-def is_valid_xml(xml):
-    filenameXML = os.path.join(dirname, "../Schemas/XSD/datasetXSD.xsd")
-    xsd = XMLSchema(etree.parse(filenameXML))
-    xml_object = etree.fromstring(xml)
-    return xsd.validate(xml_object)
 
+def get_xsd():
+    xsd = getattr(schemas, "xsd", None)
+    if xsd is None:
+        xsd = schemas.xsd = XMLSchema(xsdDocument)
+    return xsd
 
-def is_valid_json(json_string):
-    filenameJSON = os.path.join(dirname, "../Schemas/JSON/datasetJSON.json")
-    with open(filenameJSON) as file:
-        try:
-            schema = json.load(file)
-        except json.JSONDecodeError:
-            return False
-    json_object = json.loads(json_string)
-    ref_resolver = jsonschema.RefResolver(base_uri='file:' + filenameJSON + '/', referrer=schema)
+
+# lxml locks a parser while it parses, so every thread gets its own parser as
+# well and the request bodies are parsed in parallel too
+parsers = threading.local()
+
+
+def get_parser():
+    parser = getattr(parsers, "parser", None)
+    if parser is None:
+        parser = parsers.parser = etree.XMLParser(resolve_entities=False, no_network=True)
+    return parser
+
+
+# Compiled once from the product schema in the JSON schema file, so validating a
+# product is a plain function call. The server gives every product its ID, so a
+# body does not need a productID
+filenameJSON = os.path.join(dirname, "../Schemas/JSON/datasetJSON.json")
+with open(filenameJSON) as file:
+    productSchema = json.load(file)["properties"]["product"]
+productSchema["required"] = [field for field in productSchema["required"] if field != "productID"]
+productValidator = fastjsonschema.compile(productSchema)
+
+
+def is_valid_xml(xml_object):
+    return get_xsd().validate(xml_object)
+
+
+def is_valid_json(json_object):
     try:
-        jsonschema.validate(json_object, schema, resolver=ref_resolver)
+        productValidator(json_object)
         return True
-    except jsonschema.exceptions.ValidationError as errorMessage:
+    except fastjsonschema.JsonSchemaException as errorMessage:
         print(errorMessage.message)
         return False
@@ -0,0 +1,4 @@
+from main import app
+
+# The entry point for a production WSGI server like gunicorn
+application = app